@@ -434,6 +434,7 @@ class SQLGlotCompiler(abc.ABC):
     # UPPERCASE values to handle inheritance, do not modify directly here.
     extra_supported_ops: ClassVar[frozenset[type[ops.Node]]] = frozenset()
     lowered_ops: ClassVar[dict[type[ops.Node], pats.Replace]] = {}
+    lowered_ops_pattern: ClassVar[pats.Pattern | None] = None
 
     def __init__(self) -> None:
         self.f = FuncGen(copy=self.__class__.copy_func_args)
@@ -509,6 +510,11 @@ class SQLGlotCompiler(abc.ABC):
         cls.lowered_ops = lowered_ops
         cls.extra_supported_ops = frozenset(extra_supported_ops)
 
+        # combine the lowering rules once rather than on every compilation
+        cls.lowered_ops_pattern = (
+            reduce(operator.or_, lowered_ops.values()) if lowered_ops else None
+        )
+
     @property
     @abc.abstractmethod
     def dialect(self) -> str:
@@ -613,8 +619,8 @@ class SQLGlotCompiler(abc.ABC):
         # substitute parameters immediately to avoid having to define a
         # ScalarParameter translation rule
         params = self._prepare_params(params)
-        if self.lowered_ops:
-            op = op.replace(reduce(operator.or_, self.lowered_ops.values()))
+        if self.lowered_ops_pattern is not None:
+            op = op.replace(self.lowered_ops_pattern)
         op, ctes = sqlize(
             op,
             params=params,
@@ -3,23 +3,23 @@
 from __future__ import annotations
 
 import operator
+from collections import deque
 from collections.abc import Mapping
-from functools import reduce
+from functools import lru_cache, reduce
 from typing import TYPE_CHECKING, Any
 
-import toolz
 from public import public
 
 import ibis.common.exceptions as com
 import ibis.expr.datatypes as dt
 import ibis.expr.operations as ops
 from ibis.common.annotations import attribute
-from ibis.common.collections import FrozenDict  # noqa: TCH001
+from ibis.common.collections import FrozenDict
 from ibis.common.deferred import var
 from ibis.common.graph import Graph
-from ibis.common.patterns import InstanceOf, Object, Pattern, replace
+from ibis.common.patterns import NoMatch, Object, Pattern, replace
 from ibis.common.typing import VarTuple  # noqa: TCH001
-from ibis.expr.rewrites import d, p, replace_parameter
+from ibis.expr.rewrites import d, p
 from ibis.expr.schema import Schema
 
 if TYPE_CHECKING:
@@ -28,6 +28,15 @@ if TYPE_CHECKING:
 x = var("x")
 y = var("y")
 
+# value operations preventing subsequent Select nodes from being merged
+_MERGE_BLOCKING_OPS = (
+    ops.WindowFunction,
+    ops.ExistsSubquery,
+    ops.InSubquery,
+    ops.Unnest,
+    ops.Impure,
+)
+
 
 @public
 class CTE(ops.Relation):
@@ -66,6 +75,10 @@ class Select(ops.Relation):
     def schema(self):
         return Schema({k: v.dtype for k, v in self.selections.items()})
 
+    @attribute
+    def has_blocking_value(self):
+        return bool(self.find_below(_MERGE_BLOCKING_OPS, filter=ops.Value))
+
 
 @public
 class FirstValue(ops.Analytic):
@@ -202,7 +215,7 @@ def first_to_firstvalue(_, **kwargs):
             f"`{type(_.func).__name__.lower()}` with `where` is unsupported "
             "in a window function"
         )
-    klass = FirstValue if isinstance(_.func, ops.First) else LastValue
+    klass = FirstValue if type(_.func) is ops.First else LastValue
     return _.copy(func=klass(_.func.arg))
 
 
@@ -212,7 +225,23 @@ def remove_aliases(_, **kwargs):
     return _.arg
 
 
-def complexity(node):
+# the rewrites lowering the expression graph match on disjoint operation types,
+# so rather than trying every alternative of an `|` pattern for each node we
+# look up the single applicable rewrite by the exact type of the node
+_LOWERING_RULES: dict[type[ops.Node], Pattern] = {
+    ops.Alias: remove_aliases,
+    ops.Project: project_to_select,
+    ops.Filter: filter_to_select,
+    ops.Sort: sort_to_select,
+    ops.Distinct: distinct_to_select,
+    ops.FillNull: fill_null_to_select,
+    ops.DropNull: drop_null_to_select,
+    ops.DropColumns: drop_columns_to_select,
+    ops.WindowFunction: first_to_firstvalue,
+}
+
+
+def complexity(node, scores=None):
     """Assign a complexity score to a node.
 
     Subsequent projections can be merged into a single projection by replacing
@@ -225,19 +254,57 @@ def complexity(node):
     tree hierarchy unless there is a Field node where we don't add up the
     complexity of the referenced relation. This way we treat fields kind of like
     reusable variables considering them less complex than they were inlined.
-    """
 
-    def accum(node, *args):
-        if isinstance(node, ops.Field):
-            return 1
+    Already computed scores can be passed in `scores`, which is updated with
+    the scores of the newly visited nodes. `merge_select_select` uses this to
+    avoid rescoring the same shared subtrees for every merge candidate.
+    """
+    if scores is None:
+        scores = {}
+
+    # bind the frequently accessed objects to locals, this loop is executed
+    # for every merge candidate so the attribute lookups add up
+    lookup = scores.__getitem__
+    field = ops.Field
+
+    # iterative post-order traversal, children are scored before their parents
+    # and already scored subtrees are not visited again
+    stack = [(node, None)]
+    push, pop = stack.append, stack.pop
+    while stack:
+        current, children = pop()
+        if current in scores:
+            continue
+        elif isinstance(current, field):
+            scores[current] = 1
+        elif children is None:
+            children = current.__children__
+            push((current, children))
+            for child in children:
+                if child not in scores:
+                    push((child, None))
         else:
-            return 1 + sum(args)
+            scores[current] = 1 + sum(map(lookup, children))
 
-    return node.map_nodes(accum)[node]
+    return scores[node]
+
+
+def _field_subs(rel: Select, cache: dict) -> dict[ops.Field, ops.Value]:
+    """Map the fields referencing `rel` to the underlying value expressions.
+
+    The mappings are memoized in `cache`, so outer Select nodes referencing the
+    same inner one share the constructed Field nodes.
+    """
+    try:
+        return cache[rel]
+    except KeyError:
+        subs = {ops.Field(rel, k): v for k, v in rel.values.items()}
+        cache[rel] = subs
+        return subs
 
 
 @replace(Object(Select, Object(Select)))
-def merge_select_select(_, **kwargs):
+def merge_select_select(_, complexity_scores, field_subs, **kwargs):
     """Merge subsequent Select relations into one.
 
     This rewrites eliminates `_.parent` by merging the outer and the inner
@@ -245,16 +312,7 @@ def merge_select_select(_, **kwargs):
     from the inner Select are inlined into the outer Select.
     """
     # don't merge if either the outer or the inner select has window functions
-    blocking = (
-        ops.WindowFunction,
-        ops.ExistsSubquery,
-        ops.InSubquery,
-        ops.Unnest,
-        ops.Impure,
-    )
-    if _.find_below(blocking, filter=ops.Value):
-        return _
-    if _.parent.find_below(blocking, filter=ops.Value):
+    if _.has_blocking_value or _.parent.has_blocking_value:
         return _
 
     if _.parent.distinct:
@@ -299,16 +357,26 @@ def merge_select_select(_, **kwargs):
         # Neither query is distinct, safe to merge
         distinct = False
 
-    subs = {ops.Field(_.parent, k): v for k, v in _.parent.values.items()}
-    selections = {k: v.replace(subs, filter=ops.Value) for k, v in _.selections.items()}
+    # find the fields of the inner select referenced by the outer one in a
+    # single traversal, only those need to be substituted
+    values = (*_.selections.values(), *_.predicates, *_.qualified, *_.sort_keys)
+    graph = Graph.from_bfs(values, filter=ops.Value)
+    parent_subs = _field_subs(_.parent, field_subs)
+    subs = {node: parent_subs[node] for node in graph if node in parent_subs}
+
+    # substitute the fields in all value expressions at once, so subexpressions
+    # shared between them are rewritten only once
+    replaced = graph.replace(subs) if subs else {}
 
-    predicates = tuple(p.replace(subs, filter=ops.Value) for p in _.predicates)
-    unique_predicates = toolz.unique(_.parent.predicates + predicates)
+    selections = FrozenDict({k: replaced.get(v, v) for k, v in _.selections.items()})
 
-    qualified = tuple(p.replace(subs, filter=ops.Value) for p in _.qualified)
-    unique_qualified = toolz.unique(_.parent.qualified + qualified)
+    predicates = tuple(replaced.get(p, p) for p in _.predicates)
+    unique_predicates = tuple(dict.fromkeys(_.parent.predicates + predicates))
 
-    sort_keys = tuple(s.replace(subs, filter=ops.Value) for s in _.sort_keys)
+    qualified = tuple(replaced.get(p, p) for p in _.qualified)
+    unique_qualified = tuple(dict.fromkeys(_.parent.qualified + qualified))
+
+    sort_keys = tuple(replaced.get(s, s) for s in _.sort_keys)
     sort_key_exprs = {s.expr for s in sort_keys}
     parent_sort_keys = tuple(
         k for k in _.parent.sort_keys if k.expr not in sort_key_exprs
@@ -323,24 +391,62 @@ def merge_select_select(_, **kwargs):
         sort_keys=unique_sort_keys,
         distinct=distinct,
     )
-    return result if complexity(result) <= complexity(_) else _
+    if complexity(result, complexity_scores) <= complexity(_, complexity_scores):
+        return result
+    return _
+
+
+# relations which are extracted as CTEs if they are referenced multiple times
+_CTE_TYPES = (Select, ops.Aggregate, ops.JoinChain, ops.Set, ops.Limit, ops.Sample)
+# operations whose references to a relation don't count as a dependency
+_CTE_DONT_COUNT = (ops.Field, ops.CountStar, ops.CountDistinctStar)
+
+
+# the type checks below run for every node of the graph, memoize them per type
+# instead of walking the class hierarchy against each tuple entry every time;
+# the memo is bounded since value operation types may be created dynamically,
+# e.g. for every UDF definition
+@lru_cache(maxsize=512)
+def _is_cte_type(cls: type) -> bool:
+    return issubclass(cls, _CTE_TYPES)
+
+
+@lru_cache(maxsize=512)
+def _is_dont_count_type(cls: type) -> bool:
+    return issubclass(cls, _CTE_DONT_COUNT)
 
 
 def extract_ctes(node: ops.Relation) -> set[ops.Relation]:
-    cte_types = (Select, ops.Aggregate, ops.JoinChain, ops.Set, ops.Limit, ops.Sample)
-    dont_count = (ops.Field, ops.CountStar, ops.CountDistinctStar)
+    # count the dependents of each node during a single breadth-first search
+    # rather than constructing the graph and its inverted counterpart
+    dependents = {node: 0}
+    queue = deque([node])
+    while queue:
+        op = queue.popleft()
+        for child in op.__children__:
+            if _is_dont_count_type(type(child)):
+                continue
+            elif child in dependents:
+                dependents[child] += 1
+            else:
+                dependents[child] = 1
+                queue.append(child)
 
-    g = Graph.from_bfs(node, filter=~InstanceOf(dont_count))
     result = set()
-    for op, dependents in g.invert().items():
-        if isinstance(op, ops.View) or (
-            len(dependents) > 1 and isinstance(op, cte_types)
-        ):
+    for op, count in dependents.items():
+        if isinstance(op, ops.View) or (count > 1 and _is_cte_type(type(op))):
             result.add(op)
 
     return result
 
 
+@lru_cache(maxsize=32)
+def _combine_rewrites(rewrites: tuple[Pattern, ...]) -> Pattern:
+    # compilers pass the same rewrites on every compilation, so build the
+    # combined pattern only once per distinct sequence of rewrites
+    return reduce(operator.or_, rewrites)
+
+
 def sqlize(
     node: ops.Node,
     params: Mapping[ops.ScalarParameter, Any],
@@ -372,43 +478,54 @@ def sqlize(
 
     # apply the backend specific rewrites
     if rewrites:
-        node = node.replace(reduce(operator.or_, rewrites))
+        node = node.replace(_combine_rewrites(tuple(rewrites)))
 
     # lower the expression graph to a SQL-like relational algebra
     context = {"params": params}
-    result = node.replace(
-        replace_parameter
-        | remove_aliases
-        | project_to_select
-        | filter_to_select
-        | sort_to_select
-        | distinct_to_select
-        | fill_null_to_select
-        | drop_null_to_select
-        | drop_columns_to_select
-        | first_to_firstvalue,
-        context=context,
-    )
+
+    def lower(node, kwargs):
+        # scalar parameters are leaf nodes with a fixed replacement, substitute
+        # them directly rather than going through the pattern matching machinery
+        if type(node) is ops.ScalarParameter:
+            return ops.Literal(params[node], dtype=node.dtype)
+
+        new = node.__recreate__(kwargs) if kwargs else node
+        rule = _LOWERING_RULES.get(type(new))
+        if rule is None or (result := rule.match(new, context)) is NoMatch:
+            return new
+        return result
+
+    result = node.replace(lower)
 
     # squash subsequent Select nodes into one
     if fuse_selects:
-        result = result.replace(merge_select_select)
+        # the complexity scores and the field substitutions are memoized for
+        # the duration of this pass only
+        context = {"complexity_scores": {}, "field_subs": {}}
+        result = result.replace(merge_select_select, context=context)
 
     if post_rewrites:
-        result = result.replace(reduce(operator.or_, post_rewrites))
+        result = result.replace(_combine_rewrites(tuple(post_rewrites)))
 
     # extract common table expressions while wrapping them in a CTE node
     ctes = extract_ctes(result)
+    if not ctes:
+        # nothing to wrap, skip traversing the whole graph again
+        return result, []
 
-    if ctes:
+    # collect the wrapped relations while rewriting, the replacement visits
+    # the nodes in topological order so dependencies come before dependents
+    collected = []
 
-        def apply_ctes(node, kwargs):
-            new = node.__recreate__(kwargs) if kwargs else node
-            return CTE(new) if node in ctes else new
+    def apply_ctes(node, kwargs):
+        new = node.__recreate__(kwargs) if kwargs else node
+        if node in ctes:
+            collected.append(new)
+            return CTE(new)
+        return new
 
-        result = result.replace(apply_ctes)
-        return result, [cte.parent for cte in result.find(CTE, ordered=True)]
-    return result, []
+    result = result.replace(apply_ctes)
+    return result, collected
 
 
 # supplemental rewrites selectively used on a per-backend basis
@@ -477,7 +594,7 @@ def one_to_zero_index(_, **kwargs):
 
 @replace(ops.NthValue)
 def add_one_to_nth_value_input(_, **kwargs):
-    if isinstance(_.nth, ops.Literal):
+    if type(_.nth) is ops.Literal:
         nth = ops.Literal(_.nth.value + 1, dtype=_.nth.dtype)
     else:
         nth = ops.Add(_.nth, 1)
@@ -583,12 +700,20 @@ def lower_bucket(_, **kwargs):
 @replace(p.Capitalize)
 def lower_capitalize(_, **kwargs):
     """Rewrite Capitalize in terms of substring, concat, upper, and lower."""
-    first = ops.Uppercase(ops.Substring(_.arg, start=0, length=1))
+    arg = _.arg
+    if isinstance(arg, ops.Literal) and arg.value is not None and arg.value.isascii():
+        # evaluate the expression at compile time for literal strings, this is
+        # limited to ASCII since the case mapping of other characters differs
+        # between python and the backends
+        value = arg.value
+        return ops.Literal(value[:1].upper() + value[1:].lower(), dtype=arg.dtype)
+
+    first = ops.Uppercase(ops.Substring(arg, start=0, length=1))
     # use length instead of length - 1 to avoid backends complaining about
     # asking for negative length
     #
     # there are at most length - 1 characters, so asking for length is fine
-    rest = ops.Lowercase(ops.Substring(_.arg, start=1, length=ops.StringLength(_.arg)))
+    rest = ops.Lowercase(ops.Substring(arg, start=1, length=ops.StringLength(arg)))
     return ops.StringConcat((first, rest))
 
 
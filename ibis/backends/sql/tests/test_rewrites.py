@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import pytest
+
+import ibis
+import ibis.expr.operations as ops
+from ibis.backends.sql.rewrites import (
+    CTE,
+    FirstValue,
+    LastValue,
+    Select,
+    complexity,
+    extract_ctes,
+    lower_capitalize,
+    sqlize,
+)
+
+
+def test_complexity():
+    t = ibis.table({"a": "int64", "b": "int64"}, name="t")
+
+    a = t.a.op()
+    assert complexity(a) == 1
+
+    expr = (t.a + t.b).op()
+    assert complexity(expr) == 3
+
+    # the same subexpression is counted each time it is referenced
+    expr = ((t.a + t.b) * (t.a + t.b)).op()
+    assert complexity(expr) == 7
+
+
+def test_complexity_deep_graph():
+    t = ibis.table({"a": "int64"}, name="t")
+    expr = t.a
+    for _ in range(5000):
+        expr = expr + 1
+
+    # the traversal is iterative, so deep graphs don't hit the recursion limit
+    assert complexity(expr.op()) == 2 * 5000 + 1
+
+
+def test_extract_ctes():
+    t = ibis.table({"a": "int64", "b": "int64"}, name="t")
+    agg = t.group_by("a").aggregate(n=t.b.sum())
+
+    # referencing the same relation twice from a single node counts twice
+    expr = agg.union(agg)
+    assert extract_ctes(expr.op()) == {agg.op()}
+
+    # a single reference to a relation doesn't make it a CTE
+    expr = agg.filter(agg.n > 1)
+    assert extract_ctes(expr.op()) == set()
+
+
+def test_sqlize_ctes_from_equal_relations():
+    t = ibis.table({"a": "int64", "b": "int64"}, name="t")
+    left = t.group_by("a").aggregate(n=t.b.sum())
+    right = t.group_by("a").aggregate(n=t.b.sum())
+    assert left.op() is not right.op()
+
+    # structurally equal relations are the same CTE even if they are distinct
+    # objects, so CTE membership must not be based on object identity
+    node, ctes = sqlize(left.union(right).op(), params={})
+    assert ctes == [left.op()]
+    assert node.left == node.right == CTE(left.op())
+
+
+def test_lower_capitalize_literal():
+    expr = ibis.literal("aBc dEf").capitalize()
+    result = lower_capitalize.match(expr.op(), {})
+    assert result == ops.Literal("Abc def", dtype="string")
+
+    expr = ibis.literal(None, type="string").capitalize()
+    result = lower_capitalize.match(expr.op(), {})
+    assert isinstance(result, ops.StringConcat)
+
+    # non-ASCII literals are left to the backend's case mapping
+    for value in ("ßa", "ΌΣΟΣ", "éCOLE"):
+        expr = ibis.literal(value).capitalize()
+        result = lower_capitalize.match(expr.op(), {})
+        assert isinstance(result, ops.StringConcat)
+
+
+@pytest.mark.parametrize("cls", [CTE, Select, FirstValue, LastValue])
+def test_nodes_are_slotted(cls):
+    # arguments and cached attributes are stored in slots, so the instances
+    # don't carry a per-instance __dict__
+    slots = {name for klass in cls.__mro__ for name in getattr(klass, "__slots__", ())}
+    assert set(cls.__argnames__) <= slots
+    assert set(cls.__attributes__) <= slots
+    assert not any("__dict__" in vars(klass) for klass in cls.__mro__)
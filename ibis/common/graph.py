@@ -506,27 +506,8 @@ class Node(Hashable):
         The root node of the graph with the replaced nodes.
 
         """
-        replacements: dict[Node, Any] = {}
-
-        fn = _coerce_replacer(replacer, context)
-
-        graph, _ = Graph.from_bfs(self, filter=filter).toposort()
-        for node in graph:
-            kwargs = {}
-            # Apply already rewritten nodes to the children of the node
-            changed = False
-            for k, v in zip(node.__argnames__, node.__args__):
-                v, vchanged = _apply_replacements(v, replacements)
-                changed |= vchanged
-                kwargs[k] = v
-
-            # Call the replacer on the node with any rewritten nodes (or None
-            # if unchanged).
-            result = fn(node, kwargs if changed else None)
-            if result is not node:
-                # The node is changed, store it in the mapping of replacements
-                replacements[node] = result
-
+        graph = Graph.from_bfs(self, filter=filter)
+        replacements = graph.replace(replacer, context=context)
         return replacements.get(self, self)
 
 
@@ -639,6 +620,51 @@ class Graph(dict[Node, Sequence[Node]]):
                 result[dependency].append(node)
         return self.__class__({k: tuple(v) for k, v in result.items()})
 
+    def replace(
+        self, replacer: ReplacerLike, context: Optional[dict] = None
+    ) -> dict[Node, Any]:
+        """Match and replace the nodes of the graph.
+
+        Similar to `Node.replace` but operates on all the nodes of the graph, so
+        multiple roots sharing subgraphs can be rewritten in a single pass.
+
+        Parameters
+        ----------
+        replacer
+            A `Pattern`, `Mapping` or Callable taking the original unrewritten
+            node, and a mapping of attribute name to value of its rewritten
+            children (or None if no children were rewritten).
+        context
+            Optional context to use for the pattern matching.
+
+        Returns
+        -------
+        A mapping of the changed nodes to their replacements.
+
+        """
+        replacements: dict[Node, Any] = {}
+
+        fn = _coerce_replacer(replacer, context)
+
+        graph, _ = self.toposort()
+        for node in graph:
+            kwargs = {}
+            # Apply already rewritten nodes to the children of the node
+            changed = False
+            for k, v in zip(node.__argnames__, node.__args__):
+                v, vchanged = _apply_replacements(v, replacements)
+                changed |= vchanged
+                kwargs[k] = v
+
+            # Call the replacer on the node with any rewritten nodes (or None
+            # if unchanged).
+            result = fn(node, kwargs if changed else None)
+            if result is not node:
+                # The node is changed, store it in the mapping of replacements
+                replacements[node] = result
+
+        return replacements
+
     def toposort(self) -> Self:
         """Topologically sort the graph using Kahn's algorithm.
 
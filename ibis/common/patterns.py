@@ -1231,13 +1231,24 @@ class GenericMappingOf(Slotted, Pattern):
             return NoMatch
 
         result = {}
-        for k, v in value.items():
-            if (k := self.key.match(k, context)) is NoMatch:
+        changed = False
+        for key, val in value.items():
+            if (k := self.key.match(key, context)) is NoMatch:
                 return NoMatch
-            if (v := self.value.match(v, context)) is NoMatch:
+            if (v := self.value.match(val, context)) is NoMatch:
                 return NoMatch
+            changed |= k is not key or v is not val
             result[k] = v
 
+        # immutable mappings of the expected type don't need to be copied and
+        # rehashed if none of their items were coerced
+        if (
+            not changed
+            and isinstance(value, FrozenDict)
+            and type(value) is self.type.type
+        ):
+            return value
+
         result = self.type.match(result, context)
         if result is NoMatch:
             return NoMatch
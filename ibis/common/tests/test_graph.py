@@ -170,6 +170,22 @@ def test_replace_with_mapping():
     assert result == new_A
 
 
+def test_graph_replace_with_multiple_roots():
+    X = MyNode(name="X", children=[B])
+    Y = MyNode(name="Y", children=[B, C])
+    new_D = MyNode(name="d", children=[])
+
+    replaced = Graph.from_bfs([X, Y]).replace({D: new_D})
+    assert set(replaced) == {D, B, X, Y}
+
+    # the shared subgraph is rewritten only once
+    new_B = replaced[B]
+    assert new_B.children == [new_D, E]
+    assert replaced[X].children[0] is new_B
+    assert replaced[Y].children[0] is new_B
+    assert replaced[Y].children[1] is C
+
+
 @pytest.mark.parametrize("kind", ["pattern", "mapping", "function"])
 def test_replace_doesnt_recreate_unchanged_nodes(kind):
     A1 = MyNode(name="A1", children=[])
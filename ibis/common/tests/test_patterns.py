@@ -23,7 +23,7 @@ from typing import (
 import pytest
 
 from ibis.common.annotations import ValidationError
-from ibis.common.collections import FrozenDict
+from ibis.common.collections import FrozenDict, FrozenOrderedDict
 from ibis.common.deferred import Call, deferred, var
 from ibis.common.graph import Node as GraphNode
 from ibis.common.patterns import (
@@ -531,6 +531,18 @@ def test_mapping_of():
     assert p.match({"foo": "bar"}, context={}) == FrozenDict({"foo": "bar"})
     assert p.match({"foo": 1}, context={}) is NoMatch
 
+    # already validated frozen mappings are passed through without copying
+    value = FrozenDict({"foo": "bar"})
+    assert p.match(value, context={}) is value
+    value = FrozenOrderedDict({"foo": "bar"})
+    result = p.match(value, context={})
+    assert result == value
+    assert type(result) is FrozenDict
+
+    p = MappingOf(InstanceOf(str), CoercedTo(int), FrozenDict)
+    value = FrozenDict({"foo": "1"})
+    assert p.match(value, context={}) == FrozenDict({"foo": 1})
+
 
 class Foo:
     __match_args__ = ("a", "b")